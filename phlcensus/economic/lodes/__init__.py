@@ -1,4 +1,131 @@
+from ... import data_dir
+from ...regions import CensusTracts
+from functools import lru_cache
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import urllib.parse
+import urllib.request
+
 DEFAULT_YEAR = 2017
 
+# The file codes for each job type
+JOB_TYPES = {
+    "all": "JT00",
+    "primary": "JT01",
+    "private": "JT02",
+    "private_primary": "JT03",
+}
+
+
+@lru_cache(maxsize=32)
+def _get_tracts(year):
+    """
+    Internal function to load the census tracts for the given year.
+
+    The result is cached, so repeated downloads share a single parsed
+    GeoDataFrame; callers should not modify it in place. The ``geo_id``
+    column holds the 11-digit tract FIPS codes as int64, in sorted order.
+    """
+    return (
+        CensusTracts.get(year=year)
+        .assign(geo_id=lambda df: df.geo_id.astype(np.int64))
+        .sort_values("geo_id")
+        .reset_index(drop=True)
+    )
+
+
+def _fetch(url, refresh=False):
+    """
+    Internal function to download a raw LODES file, caching it on disk.
+
+    Files are stored in the "lodes_raw" data folder under the URL's path
+    (e.g., "data/lodes/LODES7/pa/od/..."), so later downloads of the same
+    URL are read locally; use ``refresh=True`` to download a fresh copy.
+    """
+    # NOTE: key on the full URL path, not just the file name, which is
+    # reused across LODES versions
+    path = data_dir / "lodes_raw" / urllib.parse.urlparse(url).path.lstrip("/")
+    if refresh or not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # download to a temporary file so an interrupted fetch is not cached
+        tmp_path = path.with_suffix(".part")
+        try:
+            urllib.request.urlretrieve(url, tmp_path)
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        tmp_path.replace(path)
+
+    return path
+
+
+def _group_sum(table, keys, fields):
+    """
+    Internal function to sum the fields of an Arrow table, grouping by
+    the specified key columns.
+    """
+    N = table.group_by(keys).aggregate([(col, "sum") for col in fields])
+    names = {f"{col}_sum": col for col in fields}
+    return N.rename_columns([names.get(col, col) for col in N.column_names])
+
+
+def _sum_by_tracts(path, geocodes, fields, block_size=16 << 20):
+    """
+    Internal function to sum the fields of a raw LODES file by census tract.
+
+    The file is streamed in blocks of ``block_size`` bytes; the block
+    geocodes in each chunk are truncated to tracts and summed, and the
+    partial sums are combined at the end, so the full block-level table
+    is never held in memory.
+
+    Parameters
+    ----------
+    path : Path
+        the path to the gzipped CSV file
+    geocodes : list of str
+        the block geocode columns, which are grouped by as tracts
+    fields : list of str
+        the count columns to sum
+
+    Returns
+    -------
+    N : pyarrow.Table
+        the summed fields, with one row per unique set of tracts
+    """
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types={
+                **{col: pa.int64() for col in geocodes},
+                **{col: pa.int32() for col in fields},
+            },
+            include_columns=geocodes + fields,
+        ),
+    )
+
+    partial_sums = []
+    for batch in reader:
+        chunk = pa.Table.from_batches([batch])
+
+        # Convert from blocks to tracts
+        # The tract FIPS code is the first 11 of the 15 block digits
+        for col in geocodes:
+            i = chunk.schema.get_field_index(col)
+            chunk = chunk.set_column(i, col, pc.divide(chunk[col], 10000))
+
+        partial_sums.append(_group_sum(chunk, geocodes, fields))
+
+    # A header-only file has no batches; sum an empty table instead
+    if not partial_sums:
+        partial_sums.append(_group_sum(reader.schema.empty_table(), geocodes, fields))
+
+    return _group_sum(pa.concat_tables(partial_sums), geocodes, fields)
+
+
 from .detailed import DetailedLODES
 from .summary import SummaryLODES
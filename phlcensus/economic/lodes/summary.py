@@ -1,12 +1,17 @@
 from ...core import Dataset, EPSG, data_dir
-from ...regions import CensusTracts, NTAs, PUMAs
+from ...regions import NTAs, PUMAs
 from ...aggregate import aggregate_tracts
 from ... import crosswalk
-from . import DEFAULT_YEAR
-import pandas as pd
+from . import DEFAULT_YEAR, JOB_TYPES, _fetch, _get_tracts, _group_sum, _sum_by_tracts
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
 
 __all__ = ["SummaryLODES"]
 
+# The home and work census block columns
+GEOCODES = ["h_geocode", "w_geocode"]
+
 
 class SummaryLODES(Dataset):
     """
@@ -26,14 +31,35 @@ class SummaryLODES(Dataset):
     YEARS = list(range(2002, DEFAULT_YEAR + 1))
     URL = "https://lehd.ces.census.gov/data/lodes/LODES7/pa"
 
+    # The geocode column for each kind
+    KINDS = {"work": "w_geocode", "home": "h_geocode"}
+
+    RAW_FIELDS = {
+        "S000": "total",
+        "SA01": "29_or_younger",
+        "SA02": "30_to_54",
+        "SA03": "55_or_older",
+        "SE01": "1250_or_less",
+        "SE02": "1251_to_3333",
+        "SE03": "3334_or_more",
+        "SI01": "goods_producing",
+        "SI02": "trade_transpo_utilities",
+        "SI03": "all_other_industries",
+    }
+
     @classmethod
-    def get_path(cls, year=DEFAULT_YEAR, kind="work", job_type="all"):
-        return data_dir / cls.__name__ / kind / str(year) / job_type
+    def get_path(cls, year=DEFAULT_YEAR, kind="work", job_type="all", **kwargs):
+        # NOTE: the "tracts" folder holds data summed by tract pairs; older
+        # versions cached block-level data one level up, which is not reused
+        return data_dir / cls.__name__ / kind / str(year) / job_type / "tracts"
 
     @classmethod
-    def download(cls, year=DEFAULT_YEAR, kind="w_geocode", job_type="JT00"):
+    def download(
+        cls, year=DEFAULT_YEAR, kind="w_geocode", job_type="JT00", refresh=False
+    ):
         """
-        Download the raw LODES data files for the Origin-Destination subset.
+        Download the raw LODES data files for the Origin-Destination subset,
+        summed by home and work census tract.
 
         Parameters
         ----------
@@ -44,21 +70,31 @@ class SummaryLODES(Dataset):
             the dataset's year; available dating back to 2002
         job_type : str, optional
             the types of jobs: one of "all", "primary", "private", "private_primary"
+        refresh : bool, optional
+            whether to re-download the raw files rather than using cached copies
         """
         # The main file (people who live and work in PA)
-        data = [pd.read_csv(f"{cls.URL}/od/pa_od_main_{job_type}_{year}.csv.gz")]
+        parts = ["main"]
 
         # Add aux file: people who work in PA but live out of state
         if kind == "w_geocode":
-            data.append(pd.read_csv(f"{cls.URL}/od/pa_od_aux_{job_type}_{year}.csv.gz"))
-
-        # Combine the data files
-        data = pd.concat(data).assign(
-            h_geocode=lambda df: df.h_geocode.astype(str),
-            w_geocode=lambda df: df.w_geocode.astype(str),
-        )
+            parts.append("aux")
+
+        # Download and sum the files concurrently
+        fields = list(cls.RAW_FIELDS)
+        urls = [f"{cls.URL}/od/pa_od_{part}_{job_type}_{year}.csv.gz" for part in parts]
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            partial_sums = list(
+                executor.map(
+                    lambda url: _sum_by_tracts(
+                        _fetch(url, refresh=refresh), GEOCODES, fields
+                    ),
+                    urls,
+                )
+            )
 
-        return data
+        # Combine the partial sums and only then convert to pandas
+        return _group_sum(pa.concat_tables(partial_sums), GEOCODES, fields).to_pandas()
 
     @classmethod
     def process(cls, data, year=DEFAULT_YEAR, kind="w_geocode", level="tract"):
@@ -67,25 +103,19 @@ class SummaryLODES(Dataset):
         level, e.g., neighborhood, PUMA, etc.
         """
 
-        # Convert from geo_id from blocks to tracts
-        for col in ["h_geocode", "w_geocode"]:
-            data[col] = data[col].astype(str).str.slice(0, 11)
-
         # Value-added columns to add
-        # Default is False
+        # These are 0/1 flags stored as uint8 to keep the groupby keys narrow
         value_added = ["is_resident", "work_at_home"]
         if kind == "h_geocode":
             value_added.append("work_in_center_city")
-        for col in value_added:
-            data[col] = False
 
         # load the tracts
-        tracts = CensusTracts.get(year=year).assign(
-            geo_id=lambda df: df.geo_id.astype(str)
-        )
+        tracts = _get_tracts(year)
 
         # Determine city residents
-        data.loc[data["h_geocode"].isin(tracts["geo_id"]), "is_resident"] = True
+        data["is_resident"] = np.isin(
+            data["h_geocode"].to_numpy(), tracts["geo_id"].to_numpy()
+        ).view(np.uint8)
 
         # cross walk to find work in home area
         if level != "tract":
@@ -95,35 +125,21 @@ class SummaryLODES(Dataset):
                 xwalk = crosswalk.tracts_to_ntas()
             elif level == "puma":
                 xwalk = crosswalk.tracts_to_pumas()
-            xwalk["geo_id_tract"] = xwalk["geo_id_tract"].astype(str)
-
-            # Merge in crosswalked areas
-            for col in ["h_geocode", "w_geocode"]:
-                data = data.merge(
-                    xwalk[["geo_id_tract", f"geo_id_{level}"]],
-                    left_on=col,
-                    right_on="geo_id_tract",
-                    how="left",
-                )
+            xwalk["geo_id_tract"] = xwalk["geo_id_tract"].astype(np.int64)
+
+            # Look up the crosswalked areas (tracts outside the city map to NaN)
+            areas = xwalk.set_index("geo_id_tract")[f"geo_id_{level}"]
+            home_area = data["h_geocode"].map(areas)
+            work_area = data["w_geocode"].map(areas)
 
             # Determine work in same area
-            data.loc[
-                data[f"geo_id_{level}_x"] == data[f"geo_id_{level}_y"], "work_at_home"
-            ] = True
-
-            # Remove extra columns
-            data = data.drop(
-                labels=[
-                    f"geo_id_{area}_{tag}"
-                    for area in ["tract", level]
-                    for tag in ["x", "y"]
-                ],
-                axis=1,
-            )
+            data["work_at_home"] = (home_area == work_area).to_numpy().view(np.uint8)
 
         else:
             # Determine work in home tract
-            data.loc[data["h_geocode"] == data["w_geocode"], "work_at_home"] = True
+            data["work_at_home"] = (
+                (data["h_geocode"] == data["w_geocode"]).to_numpy().view(np.uint8)
+            )
 
         # Work in Center City?
         if kind == "h_geocode":
@@ -133,15 +149,15 @@ class SummaryLODES(Dataset):
 
             # Get center city tracts
             in_center_city = xwalk_pumas["geo_name_puma"].str.contains("Center City")
-            CC_tracts = (
-                xwalk_pumas.loc[in_center_city, "geo_id_tract"].astype(str).tolist()
-            )
+            CC_tracts = xwalk_pumas.loc[in_center_city, "geo_id_tract"].astype(np.int64)
 
-            # Set to True
-            data.loc[data["w_geocode"].isin(CC_tracts), "work_in_center_city"] = True
+            # Set the flag
+            data["work_in_center_city"] = (
+                data["w_geocode"].isin(CC_tracts).to_numpy().view(np.uint8)
+            )
 
         # Sum by census tract
-        cols = [col for col in data.columns if col.startswith("S")]
+        cols = list(cls.RAW_FIELDS)
         groupby = [kind] + value_added
         N = data[groupby + cols].groupby(groupby).sum().reset_index()
 
@@ -173,11 +189,9 @@ class SummaryLODES(Dataset):
 
         # combine resident and non-resident
         # if we are doing home tracts, everyone is a resident
-        queries = ["is_resident == True"]
-        tags = ["resident"]
+        tags = {1: "resident"}
         if kind == "w_geocode":
-            queries.append("is_resident == False")
-            tags.append("nonresident")
+            tags[0] = "nonresident"
 
         # Initialize the output array -> one row per census tract
         out = (
@@ -186,36 +200,26 @@ class SummaryLODES(Dataset):
             .reset_index(drop=True)
         )
 
-        # add in non/resident columns
-        for tag, query in zip(tags, queries):
-
-            # Get the subset and sum over census tract
-            sub_df = data.query(query).groupby("geo_id")[cols].sum().reset_index()
-
-            # Merge
-            out = out.merge(
-                sub_df.rename(
-                    columns={
-                        "S000": f"{tag}_total",
-                        "SA01": f"{tag}_29_or_younger",
-                        "SA02": f"{tag}_30_to_54",
-                        "SA03": f"{tag}_55_or_older",
-                        "SE01": f"{tag}_1250_or_less",
-                        "SE02": f"{tag}_1251_to_3333",
-                        "SE03": f"{tag}_3334_or_more",
-                        "SI01": f"{tag}_goods_producing",
-                        "SI02": f"{tag}_trade_transpo_utilities",
-                        "SI03": f"{tag}_all_other_industries",
-                    }
-                ),
-                left_on="geo_id",
-                right_on="geo_id",
-                how="left",
+        # Sum over geo_id for residents and non-residents in a single pass
+        wide = (
+            data.groupby(["geo_id", "is_resident"])[cols]
+            .sum()
+            .unstack("is_resident", fill_value=0)
+            .reindex(
+                columns=[(col, resident) for resident in tags for col in cols],
+                fill_value=0,
             )
+        )
+        wide.columns = [
+            f"{tags[resident]}_{cls.RAW_FIELDS[col]}" for col, resident in wide.columns
+        ]
+
+        # add in non/resident columns
+        out = out.merge(wide.reset_index(), on="geo_id", how="left")
 
         # Add work in home tract
         out = out.merge(
-            data.query("work_at_home == True")
+            data.query("work_at_home == 1")
             .groupby("geo_id")["S000"]
             .sum()
             .reset_index()
@@ -228,7 +232,7 @@ class SummaryLODES(Dataset):
         # Add work in Center City
         if kind == "h_geocode":
             out = out.merge(
-                data.query("work_in_center_city == True")
+                data.query("work_in_center_city == 1")
                 .groupby("geo_id")["S000"]
                 .sum()
                 .reset_index()
@@ -239,26 +243,14 @@ class SummaryLODES(Dataset):
             )
 
         if kind == "w_geocode":
-            out["total"] = out[["resident_total", "nonresident_total"]].sum(axis=1)
-
-            groups = [
-                "29_or_younger",
-                "30_to_54",
-                "55_or_older",
-                "1250_or_less",
-                "1251_to_3333",
-                "3334_or_more",
-                "goods_producing",
-                "trade_transpo_utilities",
-                "all_other_industries",
-            ]
-            # Calculate totals for resident + nonresident
-            for g in groups:
-                cols = [f"{tag}_{g}" for tag in ["resident", "nonresident"]]
-                out[f"total_{g}"] = out[cols].sum(axis=1)
-
-        # Sort by geo id and reset
-        out = out.sort_values("geo_id").reset_index(drop=True)
+
+            # Calculate totals for resident + nonresident in one vectorized add
+            groups = list(cls.RAW_FIELDS.values())
+            totals = (
+                out[[f"resident_{g}" for g in groups]].to_numpy()
+                + out[[f"nonresident_{g}" for g in groups]].to_numpy()
+            )
+            out[["total" if g == "total" else f"total_{g}" for g in groups]] = totals
 
         # if we aggregated, add the right geometries
         if level != "tract":
@@ -275,6 +267,10 @@ class SummaryLODES(Dataset):
         cols = [col for col in out.columns if not col.startswith("geo")]
         out[cols] = out[cols].fillna(0)
 
+        # Tract ids are summed as integers, but returned as strings
+        if level == "tract":
+            out["geo_id"] = out["geo_id"].astype(str)
+
         return out.drop(labels=[kind], axis=1)
 
     @classmethod
@@ -305,26 +301,21 @@ class SummaryLODES(Dataset):
             raise ValueError(f"Allowed values for 'level': {allowed}")
 
         # Validate the job type
-        allowed_job_types = {
-            "all": "JT00",
-            "primary": "JT01",
-            "private": "JT02",
-            "private_primary": "JT03",
-        }
-        if job_type not in allowed_job_types:
-            values = list(allowed_job_types)
+        if job_type not in JOB_TYPES:
+            values = list(JOB_TYPES)
             raise ValueError(f"Allowed values for 'job_type': {values}")
-        job_type = allowed_job_types[job_type]
+        job_type = JOB_TYPES[job_type]
 
         # Validate the kind
-        allowed_kinds = {"work": "w_geocode", "home": "h_geocode"}
-        if kind not in allowed_kinds:
-            values = list(allowed_kinds)
+        if kind not in cls.KINDS:
+            values = list(cls.KINDS)
             raise ValueError(f"Allowed values for 'kind': {values}")
-        kind = allowed_kinds[kind]
+        kind = cls.KINDS[kind]
 
         # Get the raw census tract level data
-        data = super().get(fresh=fresh, kind=kind, year=year, job_type=job_type)
+        data = super().get(
+            fresh=fresh, kind=kind, year=year, job_type=job_type, refresh=fresh
+        )
 
         # Return processed data
         return cls.process(data, year=year, kind=kind, level=level)
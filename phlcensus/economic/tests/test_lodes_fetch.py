@@ -0,0 +1,65 @@
+from phlcensus.economic import lodes
+import urllib.request
+import pytest
+
+URL = "https://lehd.ces.census.gov/data/lodes/LODES7/pa/od/pa_od_main_JT00_2017.csv.gz"
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    """
+    Cache files in a temporary folder and record each download.
+    """
+    calls = []
+
+    def urlretrieve(url, filename):
+        calls.append(url)
+        with open(filename, "w") as f:
+            f.write(f"download {len(calls)}")
+
+    monkeypatch.setattr(lodes, "data_dir", tmp_path)
+    monkeypatch.setattr(urllib.request, "urlretrieve", urlretrieve)
+    return calls
+
+
+def test_fetch_cache_hit(downloads):
+
+    path = lodes._fetch(URL)
+    assert downloads == [URL]
+    assert path.read_text() == "download 1"
+
+    # The second fetch reads the cached file
+    assert lodes._fetch(URL) == path
+    assert downloads == [URL]
+
+
+def test_fetch_keys_on_url(downloads):
+
+    # Same file name, different LODES version
+    other = URL.replace("LODES7", "LODES8")
+    assert lodes._fetch(URL) != lodes._fetch(other)
+    assert downloads == [URL, other]
+
+
+def test_fetch_refresh(downloads):
+
+    path = lodes._fetch(URL)
+    assert lodes._fetch(URL, refresh=True) == path
+    assert downloads == [URL, URL]
+    assert path.read_text() == "download 2"
+
+
+def test_fetch_failed_download(tmp_path, monkeypatch):
+    def urlretrieve(url, filename):
+        with open(filename, "w") as f:
+            f.write("partial")
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(lodes, "data_dir", tmp_path)
+    monkeypatch.setattr(urllib.request, "urlretrieve", urlretrieve)
+
+    with pytest.raises(OSError):
+        lodes._fetch(URL)
+
+    # Nothing is left behind to be mistaken for a cached copy
+    assert not [p for p in tmp_path.rglob("*") if p.is_file()]
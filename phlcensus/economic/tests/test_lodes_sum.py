@@ -0,0 +1,57 @@
+from phlcensus.economic.lodes import _sum_by_tracts
+import numpy as np
+import pandas as pd
+import pytest
+
+GEOCODES = ["h_geocode", "w_geocode"]
+FIELDS = ["S000", "SA01", "SE01"]
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    """
+    A synthetic LODES OD file, with block geocodes in a few tracts.
+    """
+    rng = np.random.default_rng(42)
+    N = 100000
+
+    # 15-digit block geocodes: 11-digit tract + 4-digit block
+    tracts = 42101000000 + rng.integers(0, 50, size=(N, 2)) * 100
+    blocks = rng.integers(1000, 2000, size=(N, 2))
+    data = pd.DataFrame(tracts * 10000 + blocks, columns=GEOCODES)
+    for col in FIELDS:
+        data[col] = rng.integers(0, 10, size=N)
+    data["createdate"] = 20190826
+
+    path = tmp_path / "pa_od_main_JT00_2017.csv.gz"
+    data.to_csv(path, index=False)
+    return path, data
+
+
+def test_sum_by_tracts(raw_file):
+
+    path, data = raw_file
+
+    # Use a small block size to sum over many batches
+    N = _sum_by_tracts(path, GEOCODES, FIELDS, block_size=1 << 16)
+    result = N.to_pandas().sort_values(GEOCODES).reset_index(drop=True)
+
+    # Compare to summing the full file with pandas
+    expected = (
+        data.assign(**{col: data[col] // 10000 for col in GEOCODES})
+        .groupby(GEOCODES)[FIELDS]
+        .sum()
+        .reset_index()
+    )
+    assert result.columns.tolist() == GEOCODES + FIELDS
+    assert (result.to_numpy() == expected.to_numpy()).all()
+
+
+def test_sum_by_tracts_header_only(tmp_path):
+
+    path = tmp_path / "pa_od_aux_JT00_2017.csv.gz"
+    pd.DataFrame(columns=GEOCODES + FIELDS).to_csv(path, index=False)
+
+    N = _sum_by_tracts(path, GEOCODES, FIELDS)
+    assert N.num_rows == 0
+    assert N.column_names == GEOCODES + FIELDS
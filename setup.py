@@ -28,7 +28,7 @@ setup(
     packages=find_packages(),
     description="Wrangling Census data for the City of Philadelphia",
     license="MIT",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=get_requirements("requirements.txt"),
     extras_require={"dev": get_requirements("requirements.dev.txt")},
     add_package_data=True